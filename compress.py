@@ -10,31 +10,96 @@ Usage:
     
 Options:
     --ratio RATIO        Compression ratio (default: 0.5)
+    --quant {none,int8,nf4}
+                         Quantize the encoder with bitsandbytes (requires CUDA, default: none)
+    --compile            Compile the encoder with torch.compile before compressing
+    --bf16               Run the encoder in BF16
     --verbose            Print compression stats to stderr
     --help               Show this help message and exit
 """
 
 import sys
+import contextlib
 import argparse
-from llmlingua import PromptCompressor
 import time
 import os
-import torch  # Add torch import
 
 # Force CPU usage before importing other libraries that might use torch
 os.environ["CUDA_VISIBLE_DEVICES"] = ""
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 
+import torch
+from llmlingua import PromptCompressor
+
+MODEL_NAME = "microsoft/llmlingua-2-xlm-roberta-large-meetingbank"
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Compress text using LLMLingua")
     parser.add_argument("input_file", type=str, help="Input file to compress")
     parser.add_argument("output_file", type=str, help="Output file for compressed text")
     parser.add_argument("--ratio", type=float, default=0.5,
                         help="Compression ratio (default: 0.5)")
+    parser.add_argument("--quant", choices=["none", "int8", "nf4"], default="none",
+                        help="Quantize the encoder with bitsandbytes (requires CUDA, default: none)")
+    parser.add_argument("--compile", action="store_true",
+                        help="Compile the encoder with torch.compile before compressing")
+    parser.add_argument("--bf16", action="store_true",
+                        help="Run the encoder in BF16 (AVX-512 BF16/AMX CPUs, Ampere+ GPUs or macOS 14+ on Apple silicon)")
     parser.add_argument("--verbose", action="store_true",
                         help="Print compression stats to stderr")
     return parser.parse_args()
 
+def select_device(quant):
+    """Use CUDA for bitsandbytes quantization, else the Apple GPU when available, otherwise the CPU."""
+    if quant != "none":
+        return "cuda"
+    return "mps" if torch.backends.mps.is_available() else "cpu"
+
+def quantize_model(llm_lingua, quant):
+    """Reload the LLMLingua encoder with bitsandbytes INT8 or NF4 weights."""
+    from transformers import AutoModelForTokenClassification, BitsAndBytesConfig
+    
+    if quant == "int8":
+        config = BitsAndBytesConfig(load_in_8bit=True, llm_int8_threshold=6.0)
+    else:
+        config = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_quant_type="nf4",
+                                    bnb_4bit_compute_dtype=torch.bfloat16)
+    
+    # Free the FP32 weights before loading the quantized copy
+    llm_lingua.model = None
+    torch.cuda.empty_cache()
+    llm_lingua.model = AutoModelForTokenClassification.from_pretrained(
+        MODEL_NAME, quantization_config=config, device_map="auto")
+    llm_lingua.model.eval()
+
+def inference_context(device, bf16):
+    """BF16 autocast for the encoder on CPU/CUDA; on MPS --bf16 casts the weights instead."""
+    # Older torch releases reject device_type="mps" even with enabled=False
+    if not bf16 or device not in ("cpu", "cuda"):
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device, dtype=torch.bfloat16)
+
+def optimize_model(llm_lingua, device, bf16):
+    """Apply device-specific optimizations to the LLMLingua encoder."""
+    if device == "mps":
+        # BF16 halves the memory bandwidth of the transformer encoder (MPS BF16 needs macOS 14+)
+        if bf16:
+            llm_lingua.model.to(torch.bfloat16)
+        return
+    
+    # Intel Extension for PyTorch is optional; it prepacks weights for oneDNN kernels
+    try:
+        import intel_extension_for_pytorch as ipex
+    except ImportError:
+        return
+    llm_lingua.model = ipex.optimize(llm_lingua.model.eval(), dtype=torch.bfloat16 if bf16 else None)
+
+def compile_model(llm_lingua, device, bf16):
+    """Compile the encoder and run one warm-up pass so graph capture happens up front."""
+    llm_lingua.model = torch.compile(llm_lingua.model, mode="reduce-overhead", fullgraph=False)
+    with torch.inference_mode(), inference_context(device, bf16):
+        llm_lingua.compress_prompt("x " * 256, rate=0.5)
+
 def main():
     args = parse_args()
     
@@ -43,15 +108,33 @@ def main():
         print(f"Error: Input file '{args.input_file}' does not exist", file=sys.stderr)
         sys.exit(1)
     
+    if args.quant != "none":
+        # bitsandbytes needs CUDA; torch initializes CUDA lazily, so un-hiding
+        # the devices here still takes effect
+        os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+        if not torch.cuda.is_available():
+            print(f"Error: --quant {args.quant} requires a CUDA device", file=sys.stderr)
+            sys.exit(1)
+    
     # Initialize LLMLingua with default model
     try:
+        device = select_device(args.quant)
         if args.verbose:
-            print("Initializing LLMLingua...", file=sys.stderr)
-        # Explicitly force CPU
+            print(f"Initializing LLMLingua on {device}...", file=sys.stderr)
         llm_lingua = PromptCompressor(
-            model_name="microsoft/llmlingua-2-xlm-roberta-large-meetingbank",
+            model_name=MODEL_NAME,
             use_llmlingua2=True, # Whether to use llmlingua-2
-            device_map="mps")
+            device_map=device)
+        if args.quant != "none":
+            if args.verbose:
+                print(f"Quantizing encoder to {args.quant}...", file=sys.stderr)
+            quantize_model(llm_lingua, args.quant)
+        else:
+            optimize_model(llm_lingua, device, args.bf16)
+        if args.compile:
+            if args.verbose:
+                print("Compiling encoder...", file=sys.stderr)
+            compile_model(llm_lingua, device, args.bf16)
         
         # Read from input file
         if args.verbose:
@@ -66,17 +149,18 @@ def main():
         # Compress the text
         if args.verbose:
             print(f"Compressing text with target ratio: {args.ratio}...", file=sys.stderr)
-        compressed_result = llm_lingua.compress_prompt(
-            input_text, 
-            rate=0.55,
-            # Set the special parameter for LongLLMLingua
-            condition_in_question="after_condition",
-            reorder_context="sort",
-            dynamic_context_compression_ratio=0.3, # or 0.4
-            condition_compare=True,
-            context_budget="+100",
-            rank_method="longllmlingua",
-        )
+        with torch.inference_mode(), inference_context(device, args.bf16):
+            compressed_result = llm_lingua.compress_prompt(
+                input_text, 
+                rate=0.55,
+                # Set the special parameter for LongLLMLingua
+                condition_in_question="after_condition",
+                reorder_context="sort",
+                dynamic_context_compression_ratio=0.3, # or 0.4
+                condition_compare=True,
+                context_budget="+100",
+                rank_method="longllmlingua",
+            )
         
         compressed_text = compressed_result["compressed_prompt"]
         
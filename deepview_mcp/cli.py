@@ -5,7 +5,8 @@ Command-line interface for DeepView MCP.
 import sys
 import argparse
 import logging
-from .server import create_http_server, load_codebase_from_file
+import importlib.util
+from .server import clear_codebase_cache, load_codebase_entry
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,16 @@ def parse_args():
                         help="Host to bind to for HTTP transport (default: localhost)")
     parser.add_argument("--port", type=int, default=8019,
                         help="Port to bind to for HTTP transport (default: 8019)")
+    parser.add_argument("--context-cache-ttl", type=int, default=3600,
+                        help="Seconds to keep the codebase in a Gemini context cache, 0 to disable (default: 3600)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of uvicorn worker processes for HTTP transport (default: 1)")
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="Maximum concurrent Gemini calls per worker, 0 for unlimited (default: 0)")
+    parser.add_argument("--requests-per-minute", type=int, default=0,
+                        help="Maximum Gemini calls per minute per worker, 0 for unlimited (default: 0)")
+    parser.add_argument("--compress-ratio", type=float, default=None,
+                        help="Compress loaded codebases with LLMLingua-2 to this ratio (requires llmlingua)")
     return parser.parse_args()
 
 def main():
@@ -37,6 +48,12 @@ def main():
     args.port = int(os.getenv("MCP_PORT", str(args.port)))
     args.log_level = os.getenv("LOG_LEVEL", args.log_level)
     args.model = os.getenv("GEMINI_MODEL", args.model)
+    args.context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", str(args.context_cache_ttl)))
+    args.workers = int(os.getenv("MCP_WORKERS", str(args.workers)))
+    args.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", str(args.max_concurrency)))
+    args.requests_per_minute = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", str(args.requests_per_minute)))
+    if os.getenv("COMPRESS_RATIO"):
+        args.compress_ratio = float(os.getenv("COMPRESS_RATIO"))
     
     # Configure logging
     logging.basicConfig(
@@ -46,39 +63,63 @@ def main():
     )
     
     # Load codebase if provided
+    codebase = None
     if args.codebase_file:
         try:
-            load_codebase_from_file(args.codebase_file)
+            codebase = load_codebase_entry(args.codebase_file)
             logger.info(f"Loaded codebase from command line argument: {args.codebase_file}")
         except Exception as e:
             logger.error(f"Failed to load codebase from command line argument: {str(e)}")
             sys.exit(1)
     else:
         # Try to load from default codebase directory if it exists
-        default_codebase = "/app/codebase"
-        if os.path.exists(default_codebase):
-            codebase_files = [f for f in os.listdir(default_codebase) if f.endswith(('.txt', '.md'))]
+        default_codebase_dir = "/app/codebase"
+        if os.path.exists(default_codebase_dir):
+            codebase_files = [f for f in os.listdir(default_codebase_dir) if f.endswith(('.txt', '.md'))]
             if codebase_files:
                 try:
-                    codebase_path = os.path.join(default_codebase, codebase_files[0])
-                    load_codebase_from_file(codebase_path)
+                    codebase_path = os.path.join(default_codebase_dir, codebase_files[0])
+                    codebase = load_codebase_entry(codebase_path)
                     logger.info(f"Loaded codebase from default directory: {codebase_path}")
                 except Exception as e:
                     logger.warning(f"Failed to load codebase from default directory: {str(e)}")
         
-        if not hasattr(load_codebase_from_file, '_loaded'):
+        if codebase is None:
             logger.warning("No codebase file provided. You'll need to provide one as a parameter to the deepview function.")
     
     # Create and run HTTP server (simplified approach following lzdocs pattern)
     logger.info(f"Starting DeepView MCP server with model: {args.model}")
     logger.info(f"Server will be available at http://{args.host}:{args.port}")
     logger.info(f"MCP protocol endpoint: http://{args.host}:{args.port}/deepview-mcp/mcp")
-    logger.info("REST endpoints: /health, /{project_name}, /codebase/{project_name}")
+    logger.info("REST endpoints: /health, /{project_name}, /codebase/{project_name}, POST /reindex")
+    
+    # Worker processes build their own app from these (see server.build_app)
+    os.environ["GEMINI_MODEL"] = args.model
+    os.environ["MCP_HOST"] = args.host
+    os.environ["MCP_PORT"] = str(args.port)
+    os.environ["GEMINI_CONTEXT_CACHE_TTL"] = str(args.context_cache_ttl)
+    os.environ["GEMINI_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    os.environ["GEMINI_REQUESTS_PER_MINUTE"] = str(args.requests_per_minute)
+    if args.compress_ratio:
+        os.environ["COMPRESS_RATIO"] = str(args.compress_ratio)
+    if codebase is not None:
+        os.environ["DEEPVIEW_CODEBASE_FILE"] = os.path.abspath(codebase.path)
+        if args.workers > 1:
+            # Worker processes load their own copy; don't keep one in the supervisor
+            codebase = None
+            clear_codebase_cache()
+    
+    # uvloop is not available on Windows; fall back to uvicorn's defaults there
+    loop = "uvloop" if sys.platform != "win32" and importlib.util.find_spec("uvloop") else "auto"
+    http = "httptools" if importlib.util.find_spec("httptools") else "auto"
     
     try:
         import uvicorn
-        app = create_http_server(model_name=args.model, host=args.host, port=args.port)
-        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level.lower())
+        uvicorn.run("deepview_mcp.server:build_app", factory=True,
+                    host=args.host, port=args.port,
+                    loop=loop, http=http,
+                    workers=args.workers,
+                    log_level=args.log_level.lower())
     except ImportError:
         logger.error("uvicorn not available for HTTP transport")
         sys.exit(1)
@@ -1,66 +1,652 @@
 import os
+import asyncio
+import contextlib
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import functools
+import queue
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, AsyncIterator, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
 import google.generativeai as genai
+from google.api_core.exceptions import BadRequest, NotFound, PermissionDenied
+from google.generativeai import caching
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.datastructures import Headers
+import orjson
 from dotenv import load_dotenv
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global variable to store codebase content
-codebase_content = ""
+# Maximum number of Gemini answers kept in the answer cache
+ANSWER_CACHE_SIZE = 256
 
-def load_codebase_from_file(file_path: str, update_global: bool = True) -> str:
+# Seconds a cached answer is served before Gemini is asked again
+ANSWER_CACHE_TTL = 3600.0
+
+# LLMLingua-2 model used to pre-compress codebases
+COMPRESSOR_MODEL = "microsoft/llmlingua-2-xlm-roberta-large-meetingbank"
+
+# Maximum number of codebase files kept in memory, per worker process
+CODEBASE_CACHE_SIZE = 16
+
+# Maximum total bytes of codebase snapshots kept in memory, per worker process;
+# the most recently used codebase is kept even if it alone is larger
+CODEBASE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Media types of streamed answers, which are sent without gzip
+STREAMED_MEDIA_TYPES = frozenset({"text/event-stream", "text/plain"})
+
+# Codebases smaller than this many bytes (~1,024 tokens, Gemini's smallest
+# cacheable context) are sent inline instead of through a context cache
+CONTEXT_CACHE_MIN_BYTES = 4096
+
+# Seconds to wait before retrying a context cache that failed with a transient error
+CONTEXT_CACHE_RETRY_DELAY = 60.0
+
+SYSTEM_PROMPT = (
+    "You are a diligent programming assistant analyzing code. Your task is to "
+    "answer questions about the provided code repository accurately and in detail. "
+    "Always include specific references to files, functions, and class names in your "
+    "responses. At the end, list related files, functions, and classes that could be "
+    "potentially relevant to the question, explaining their relevance."
+)
+
+# Static pieces of the Gemini prompts. Prompts are assembled with "".join so the
+# codebase text is copied exactly once into the final prompt string.
+_PROMPT_PREFIX = (
+    "\nBelow is the content of a code repository for project '{project_name}'. \n"
+    "Please answer the following question about the code:\n\n<QUESTION>\n"
+)
+_PROMPT_MID = "\n</QUESTION>\n\n<CODE_REPOSITORY>\n```\n"
+_PROMPT_SUFFIX = "\n```\n</CODE_REPOSITORY>"
+
+# Context-cached variant: the codebase goes into the cache, the question is sent per call
+_CODEBASE_PROMPT_PREFIX = (
+    "\nBelow is the content of a code repository for project '{project_name}'.\n\n"
+    "<CODE_REPOSITORY>\n```\n"
+)
+_QUESTION_PROMPT_PREFIX = "\nPlease answer the following question about the code:\n\n<QUESTION>\n"
+_QUESTION_PROMPT_SUFFIX = "\n</QUESTION>"
+
+# Pre-serialized bodies for the OAuth discovery probes
+_OAUTH_NOT_SUPPORTED_BODY = b'{"error":"not_supported"}'
+_REGISTRATION_NOT_SUPPORTED_BODY = b'{"error":"registration_not_supported"}'
+
+# Pre-serialized bodies for the static MCP responses
+_MCP_INFO_BODY = orjson.dumps({
+    "name": "deepview-mcp",
+    "version": "1.0.0",
+    "description": "DeepView MCP Server for codebase analysis",
+    "protocol": "mcp",
+    "capabilities": ["tools"]
+})
+_INITIALIZE_RESULT = orjson.dumps({
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {}
+    },
+    "serverInfo": {
+        "name": "deepview-mcp",
+        "version": "1.0.0"
+    }
+})
+_TOOLS_LIST_RESULT = orjson.dumps({
+    "tools": [
+        {
+            "name": "deepview",
+            "description": "Analyze codebase content with AI",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string", "description": "Question about the codebase"},
+                    "codebase_file": {"type": "string", "description": "Optional codebase file path"}
+                },
+                "required": ["question"]
+            }
+        },
+        {
+            "name": "list_codebase_files",
+            "description": "List available codebase files",
+            "inputSchema": {"type": "object", "properties": {}}
+        }
+    ]
+})
+
+# Seconds a project lookup that found no codebase file is remembered
+MISSING_PROJECT_TTL = 5.0
+MISSING_PROJECT_CACHE_SIZE = 1024
+
+# Seconds the list_codebase_files listing is served before the tree is walked again
+CODEBASE_LISTING_TTL = 30.0
+
+# Directories searched for project subdirectories, in priority order
+CODEBASE_ROOTS = ["/app/codebase", "./codebase"]
+
+# Codebase filenames looked for in a project directory, in priority order
+CODEBASE_FILENAMES = ["codebase.xml", "codebase.txt", "codebase.md", "codebase.json"]
+
+# File extensions listed by the list_codebase_files tool
+CODEBASE_EXTENSIONS = frozenset({"xml", "txt", "md", "json"})
+
+
+@dataclass
+class CodebaseEntry:
+    """
+    A snapshot of a codebase file and everything derived from its content.
+    
+    The file's bytes are read once per (path, mtime, size), so an entry stays
+    consistent with its sha256 even if the file is rewritten while requests
+    are still using it. The LLMLingua-2 compressed text and the Gemini context
+    caches live on the entry, so they are reused for as long as the file is
+    unchanged and are dropped together with the snapshot when it goes stale;
+    its context caches are then deleted on Gemini's side as well.
+    """
+    path: str
+    sha256: str
+    mtime_ns: int
+    size: int
+    data: bytes = field(repr=False)
+    compressed: Optional[str] = field(default=None, repr=False)
+    compression_scheduled: bool = False
+    # Context caches keyed by (model name, project name, compressed); None marks a rejected creation
+    context_caches: Dict[Tuple[str, str, bool], Optional[caching.CachedContent]] = field(
+        default_factory=dict, repr=False)
+    # Models bound to each live context cache, built once per cache instead of per question
+    context_models: Dict[Tuple[str, str, bool], genai.GenerativeModel] = field(
+        default_factory=dict, repr=False)
+    # Monotonic time before which a key whose creation failed transiently is not retried
+    context_cache_retry_at: Dict[Tuple[str, str, bool], float] = field(
+        default_factory=dict, repr=False)
+    # Per-key locks so one upload doesn't hold up questions about other codebases
+    context_cache_locks: Dict[Tuple[str, str, bool], asyncio.Lock] = field(
+        default_factory=dict, repr=False)
+    
+    @property
+    def content(self) -> str:
+        """Decode the snapshot; callers should hold on to the result only as long as needed."""
+        return self.data.decode('utf-8')
+
+
+# LRU cache of (answer, expiry) keyed by (model, project, codebase hash, normalized question)
+_answer_cache: "OrderedDict[Tuple[str, str, str, str], Tuple[str, float]]" = OrderedDict()
+
+# Resolved codebase file paths keyed by (requested path, cwd)
+_path_cache: Dict[Tuple[str, str], str] = {}
+
+# Resolved project codebase files keyed by (project, filename, cwd), with their directory mtime
+_project_path_cache: Dict[Tuple[str, Optional[str], str], Tuple[str, int]] = {}
+
+# LRU cache of codebase snapshots keyed by absolute path
+_codebase_cache: "OrderedDict[str, CodebaseEntry]" = OrderedDict()
+# Codebases are loaded from worker threads, so cache bookkeeping is serialized
+_codebase_cache_lock = threading.Lock()
+
+# Codebases waiting for LLMLingua-2 compression, consumed by one daemon thread so
+# an in-progress compression never holds up interpreter shutdown
+_compression_queue: "queue.Queue[Tuple[CodebaseEntry, float]]" = queue.Queue()
+_compression_thread: Optional[threading.Thread] = None
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Serialize content with orjson into a JSON response."""
+    return Response(orjson.dumps(content), status_code=status_code, media_type="application/json")
+
+
+def jsonrpc_result_response(request_id: Any, result: bytes) -> Response:
+    """Wrap a pre-serialized JSON-RPC result with the request's id."""
+    body = b"".join((b'{"jsonrpc":"2.0","id":', orjson.dumps(request_id), b',"result":', result, b"}"))
+    return Response(body, media_type="application/json")
+
+
+@functools.lru_cache(maxsize=256)
+def _project_for(codebase_file: str) -> str:
+    """Name a project after the directory holding its codebase file."""
+    return os.path.basename(os.path.dirname(codebase_file))
+
+
+def _context_cache_is_live(cached: caching.CachedContent) -> bool:
+    """Whether a context cache outlives a long generation started now."""
+    return cached.expire_time > datetime.now(timezone.utc) + timedelta(seconds=60)
+
+
+def _delete_context_caches(caches: "list[caching.CachedContent]") -> None:
+    """Delete context caches one by one, logging the ones Gemini already dropped."""
+    for cached in caches:
+        try:
+            cached.delete()
+            logger.info(f"Deleted context cache {cached.name}")
+        except Exception as e:
+            # Already expired or deleted; Gemini drops it at its TTL either way
+            logger.warning(f"Could not delete context cache {cached.name}: {str(e)}")
+
+
+def release_context_caches(caches: Iterable[Optional[caching.CachedContent]]) -> None:
+    """Delete superseded context caches on a daemon thread so they stop accruing storage."""
+    caches = [cached for cached in caches if cached is not None]
+    if caches:
+        threading.Thread(target=_delete_context_caches, args=(caches,),
+                         name="context-cache-cleanup", daemon=True).start()
+
+
+def _normalize_question(question: str) -> str:
+    """Collapse whitespace so trivially different phrasings share a cache entry."""
+    return " ".join(question.split())
+
+
+def get_cached_answer(key: Tuple[str, str, str, str]) -> Optional[str]:
+    """Return an unexpired cached answer and mark it as recently used."""
+    cached = _answer_cache.get(key)
+    if cached is None:
+        return None
+    answer, expires_at = cached
+    if time.monotonic() >= expires_at:
+        del _answer_cache[key]
+        return None
+    _answer_cache.move_to_end(key)
+    return answer
+
+
+def store_answer(key: Tuple[str, str, str, str], answer: str) -> None:
+    """Cache an answer, evicting the least recently used entry when full."""
+    _answer_cache[key] = (answer, time.monotonic() + ANSWER_CACHE_TTL)
+    _answer_cache.move_to_end(key)
+    while len(_answer_cache) > ANSWER_CACHE_SIZE:
+        _answer_cache.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_prompt_compressor():
+    """Load the LLMLingua-2 compressor once; llmlingua is an optional dependency."""
+    from llmlingua import PromptCompressor
+    return PromptCompressor(model_name=COMPRESSOR_MODEL, use_llmlingua2=True, device_map="cpu")
+
+
+def _compress_codebase(entry: CodebaseEntry, compress_ratio: float) -> None:
+    """Compress a codebase with LLMLingua-2 and store the result on its entry."""
+    try:
+        logger.info(f"Compressing codebase {entry.path} with ratio {compress_ratio}")
+        result = _get_prompt_compressor().compress_prompt(entry.content, rate=compress_ratio)
+        entry.compressed = result["compressed_prompt"]
+        logger.info(f"Compressed codebase {entry.path} to {len(entry.compressed)} characters")
+    except Exception as e:
+        logger.error(f"Error compressing codebase {entry.path}: {str(e)}")
+
+
+def _is_cached(entry: CodebaseEntry) -> bool:
+    """Whether entry is still the current snapshot of its file."""
+    with _codebase_cache_lock:
+        return _codebase_cache.get(os.path.abspath(entry.path)) is entry
+
+
+def _compression_worker() -> None:
+    """Compress queued codebases one at a time, skipping ones evicted or replaced meanwhile."""
+    while True:
+        entry, compress_ratio = _compression_queue.get()
+        if _is_cached(entry):
+            _compress_codebase(entry, compress_ratio)
+        else:
+            logger.info(f"Skipping compression of stale codebase {entry.path}")
+
+
+def schedule_compression(entry: CodebaseEntry, compress_ratio: Optional[float]) -> None:
+    """Compress a codebase in the background once per entry; failures are not retried."""
+    global _compression_thread
+    if not compress_ratio:
+        return
+    with _codebase_cache_lock:
+        if entry.compression_scheduled:
+            return
+        entry.compression_scheduled = True
+        if _compression_thread is None:
+            _compression_thread = threading.Thread(target=_compression_worker, name="llmlingua", daemon=True)
+            _compression_thread.start()
+    _compression_queue.put((entry, compress_ratio))
+
+
+class AnswerGZipMiddleware(GZipMiddleware):
+    """
+    GZip middleware that leaves streamed answers uncompressed.
+    
+    A gzip stream only emits bytes once enough input is buffered, which would
+    hold back streamed chunks. Responses are routed by their Content-Type:
+    SSE tool calls and ?stream=true REST answers (text/plain) go straight to
+    the client, while JSON replies, including MCP ones, are still compressed.
+    """
+    
+    def __init__(self, app, *args, **kwargs):
+        self.inner_app = app
+        super().__init__(self._route_by_media_type, *args, **kwargs)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            # Hand the uncompressed send through to _route_by_media_type
+            scope = {**scope, "deepview.raw_send": send}
+        await super().__call__(scope, receive, send)
+    
+    async def _route_by_media_type(self, scope, receive, send):
+        raw_send = scope.get("deepview.raw_send")
+        if raw_send is None:
+            await self.inner_app(scope, receive, send)
+            return
+        
+        target = send
+        
+        async def route(message):
+            nonlocal target
+            if message["type"] == "http.response.start":
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                if content_type.partition(";")[0].strip().lower() in STREAMED_MEDIA_TYPES:
+                    target = raw_send
+            await target(message)
+        
+        await self.inner_app(scope, receive, route)
+
+
+class TokenBucket:
+    """
+    Async token bucket allowing rate acquisitions per period seconds.
+    
+    Callers wait in arrival order until a token is available, so bursts up
+    to rate go through immediately and sustained load is smoothed to the
+    configured rate instead of being rejected.
+    """
+    
+    def __init__(self, rate: int, period: float = 60.0):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait for and take one token."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+@functools.lru_cache(maxsize=8)
+def get_generative_model(model_name: str, system_prompt: str) -> genai.GenerativeModel:
+    """Return a shared GenerativeModel for a model name and system prompt."""
+    return genai.GenerativeModel(model_name, system_instruction=system_prompt)
+
+
+def check_hash_backend() -> None:
+    """Warn when hashlib.sha256 cannot use OpenSSL's SHA-NI / ARMv8 SHA2 code paths."""
+    if "sha256" not in hashlib.algorithms_available or hashlib.sha256.__name__ != "openssl_sha256":
+        logger.warning("hashlib.sha256 is not backed by OpenSSL; hashing large codebases will be slow")
+    elif ssl.OPENSSL_VERSION_INFO < (1, 1, 1):
+        logger.warning(f"{ssl.OPENSSL_VERSION} predates SHA extension support; hashing large codebases will be slow")
+
+
+def _read_codebase(path: str) -> CodebaseEntry:
+    """Return the codebase snapshot at path, rereading it only when its mtime or size changed."""
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    
+    with _codebase_cache_lock:
+        entry = _codebase_cache.get(abs_path)
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            _codebase_cache.move_to_end(abs_path)
+            return entry
+    
+    if st.st_size == 0:
+        raise FileNotFoundError(f"Codebase file is empty: {path}")
+    
+    logger.info(f"Loading codebase from: {path}")
+    # A memory map would reuse the page cache, but a file truncated in place
+    # (shell redirection, repomix regenerating it) turns reads of the mapping
+    # into SIGBUS; an in-memory copy can't be invalidated under a request.
+    with open(abs_path, 'rb') as f:
+        for _ in range(3):
+            before = os.fstat(f.fileno())
+            f.seek(0)
+            data = f.read()
+            st = os.fstat(f.fileno())
+            # Retry if the file was rewritten while it was being read
+            if before.st_mtime_ns == st.st_mtime_ns and before.st_size == st.st_size == len(data):
+                break
+        else:
+            raise OSError(f"Codebase file kept changing while it was read: {path}")
+    
+    # Hash the whole snapshot in one call so OpenSSL runs its SHA-NI loop over
+    # it without a Python-level chunk loop
+    entry = CodebaseEntry(
+        path=path,
+        sha256=hashlib.sha256(data).hexdigest(),
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+        data=data
+    )
+    logger.info(f"Loaded codebase from {path}, size: {st.st_size} bytes")
+    
+    dropped = []
+    with _codebase_cache_lock:
+        stale = _codebase_cache.get(abs_path)
+        if stale is not None:
+            dropped.append(stale)
+        _codebase_cache[abs_path] = entry
+        _codebase_cache.move_to_end(abs_path)
+        cached_bytes = sum(cached.size for cached in _codebase_cache.values())
+        while len(_codebase_cache) > 1 and (len(_codebase_cache) > CODEBASE_CACHE_SIZE
+                                            or cached_bytes > CODEBASE_CACHE_MAX_BYTES):
+            _, evicted = _codebase_cache.popitem(last=False)
+            cached_bytes -= evicted.size
+            dropped.append(evicted)
+    
+    # Context caches of a changed or evicted snapshot can't be reached again
+    release_context_caches(cached for stale in dropped for cached in list(stale.context_caches.values()))
+    return entry
+
+
+def clear_codebase_cache() -> None:
+    """Drop every cached codebase snapshot, e.g. in a process that won't serve requests."""
+    with _codebase_cache_lock:
+        dropped = list(_codebase_cache.values())
+        _codebase_cache.clear()
+    release_context_caches(cached for entry in dropped for cached in list(entry.context_caches.values()))
+
+
+def resolve_project_file(project_path: str, filename: Optional[str] = None) -> str:
+    """
+    Find the codebase file of a project, checking each codebase root in priority order.
+    
+    Resolutions are cached and reused while the project directory's mtime is
+    unchanged, so adding or removing a codebase file invalidates them.
+    
+    Args:
+        project_path: Project directory name under a codebase root
+        filename: Optional filename to prefer over the default codebase filenames
+    
+    Returns:
+        Path to the codebase file
+    """
+    cache_key = (project_path, filename, os.getcwd())
+    cached = _project_path_cache.get(cache_key)
+    if cached is not None:
+        full_path, dir_mtime_ns = cached
+        try:
+            if os.stat(os.path.dirname(full_path)).st_mtime_ns == dir_mtime_ns:
+                return full_path
+        except FileNotFoundError:
+            pass
+        # pop, not del: concurrent lookups in worker threads may have dropped it already
+        _project_path_cache.pop(cache_key, None)
+    
+    for root in CODEBASE_ROOTS:
+        project_dir = Path(root) / project_path
+        try:
+            dir_mtime_ns = project_dir.stat().st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        
+        # One directory listing instead of an exists() probe per candidate name
+        try:
+            with os.scandir(project_dir) as it:
+                names = {e.name for e in it if e.is_file()}
+        except OSError:
+            continue
+        candidates = [fname for fname in CODEBASE_FILENAMES if fname in names]
+        # Overrides with a subdirectory aren't in the listing and need their own probe
+        if filename and (filename in names or ("/" in filename and (project_dir / filename).is_file())):
+            candidates.insert(0, filename)
+        
+        if candidates:
+            full_path = f"{root}/{project_path}/{candidates[0]}"
+            _project_path_cache[cache_key] = (full_path, dir_mtime_ns)
+            return full_path
+    
+    raise FileNotFoundError(f"No codebase file found in project: {project_path}")
+
+
+def build_project_index() -> Dict[str, str]:
+    """
+    Map each project directory under the codebase roots to its default codebase file.
+    
+    Projects found in an earlier root take precedence, and within a project the
+    first existing name from CODEBASE_FILENAMES is used.
+    """
+    index: Dict[str, str] = {}
+    for root in CODEBASE_ROOTS:
+        try:
+            with os.scandir(root) as it:
+                project_dirs = [e for e in it if e.is_dir() and e.name not in index]
+        except OSError:
+            continue
+        
+        for project_dir in project_dirs:
+            try:
+                with os.scandir(project_dir.path) as it:
+                    names = {e.name for e in it if e.is_file()}
+            except OSError:
+                continue
+            for fname in CODEBASE_FILENAMES:
+                if fname in names:
+                    index[project_dir.name] = f"{root}/{project_dir.name}/{fname}"
+                    break
+    
+    logger.info(f"Indexed {len(index)} codebase projects")
+    return index
+
+
+def iter_codebase_files(root: str, codebase_dir: str) -> Iterator[str]:
+    """
+    Recursively yield codebase files under root, relative to codebase_dir.
+    
+    Uses os.scandir so directory entry types come from the directory listing
+    instead of a stat per entry. Like os.walk, symlinked directories are not
+    followed and unreadable directories are skipped.
+    """
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_codebase_files(entry.path, codebase_dir)
+                elif entry.is_file():
+                    _, dot, ext = entry.name.rpartition(".")
+                    if dot and ext in CODEBASE_EXTENSIONS:
+                        yield os.path.relpath(entry.path, codebase_dir)
+    except OSError:
+        return
+
+
+def load_codebase_from_file(file_path: str, compress_ratio: Optional[float] = None) -> str:
     """
     Load codebase content from a file.
     
     Args:
         file_path: Path to the codebase file
-        update_global: Whether to update the global codebase_content variable
+        compress_ratio: If set, compress the codebase with LLMLingua-2 in the background
     
     Returns:
         The loaded codebase content as a string
     """
-    global codebase_content
+    return load_codebase_entry(file_path, compress_ratio).content
+
+
+def load_codebase_entry(file_path: str, compress_ratio: Optional[float] = None) -> CodebaseEntry:
+    """
+    Load a codebase file, reusing the cached snapshot while the file is unchanged.
+    
+    Args:
+        file_path: Path to the codebase file
+        compress_ratio: If set, compress the codebase with LLMLingua-2 in the background
     
+    Returns:
+        The loaded codebase as a CodebaseEntry
+    """
     try:
-        # Try multiple possible paths
-        possible_paths = [
-            file_path,
-            f"/app/{file_path}",
-            f"./codebase/{file_path}",
-            f"/app/codebase/{file_path}"
-        ]
+        cache_key = (file_path, os.getcwd())
+        entry = None
         
-        content = ""
-        for path in possible_paths:
-            if os.path.exists(path):
-                logger.info(f"Loading codebase from: {path}")
-                with open(path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                logger.info(f"Loaded codebase from {path}, size: {len(content)} characters")
-                break
+        # A cached resolution is validated by the stat in _read_codebase
+        cached_path = _path_cache.get(cache_key)
+        if cached_path is not None:
+            try:
+                entry = _read_codebase(cached_path)
+            except FileNotFoundError:
+                # pop, not del: concurrent loads in worker threads may have dropped it already
+                _path_cache.pop(cache_key, None)
         
-        if not content:
-            raise FileNotFoundError(f"Codebase file not found at any of these paths: {possible_paths}")
-        
-        if update_global:
-            codebase_content = content
+        if entry is None:
+            # Try multiple possible paths
+            possible_paths = [
+                file_path,
+                f"/app/{file_path}",
+                f"./codebase/{file_path}",
+                f"/app/codebase/{file_path}"
+            ]
+            
+            for path in possible_paths:
+                if os.path.exists(path):
+                    entry = _read_codebase(path)
+                    _path_cache[cache_key] = path
+                    break
             
-        return content
+            if entry is None:
+                raise FileNotFoundError(f"Codebase file not found at any of these paths: {possible_paths}")
+        
+        schedule_compression(entry, compress_ratio)
+        return entry
         
     except Exception as e:
         logger.error(f"Error loading codebase: {str(e)}")
         raise
 
-def create_http_server(model_name: str = "gemini-2.5-flash", host: str = "0.0.0.0", port: int = 8019):
+def create_http_server(model_name: str = "gemini-2.5-flash", host: str = "0.0.0.0", port: int = 8019,
+                       context_cache_ttl: int = 3600, compress_ratio: Optional[float] = None,
+                       max_concurrency: int = 0, requests_per_minute: int = 0):
     """
     Create a simple HTTP server that handles both MCP protocol and REST endpoints.
     Following the lzdocs pattern for Windsurf integration.
+    
+    The system prompt and codebase are stored in a Gemini context cache for
+    context_cache_ttl seconds so follow-up questions only send the question.
+    Set context_cache_ttl to 0 to always send the full prompt.
+    
+    When compress_ratio is set, loaded codebases are compressed with LLMLingua-2
+    in the background and the compressed text is sent once it is ready.
+    
+    max_concurrency caps the number of in-flight Gemini calls to stay within
+    the API's rate limits, and requests_per_minute spaces Gemini calls out to
+    the project's quota; 0 disables either limit. Both apply per worker, and
+    answers served from the cache count against neither.
     """
     
     # Load environment variables
@@ -74,69 +660,281 @@ def create_http_server(model_name: str = "gemini-2.5-flash", host: str = "0.0.0.
     
     # Configure Gemini API
     genai.configure(api_key=GEMINI_API_KEY)
+    check_hash_backend()
+    
+    # Built once per server; the SDK reuses its async client and channel across calls
+    generative_model = get_generative_model(model_name, SYSTEM_PROMPT)
     
     # Create FastAPI app
     app = FastAPI(title="DeepView MCP Server", description="Codebase analysis server with MCP support")
+    # Answers can be tens of KB of text; compress them for remote clients
+    app.add_middleware(AnswerGZipMiddleware, minimum_size=1024, compresslevel=5)
+    
+    # Default codebase file of every project, built once instead of searched per request
+    app.state.project_index = build_project_index()
+    # Monotonic time of recent lookups for unknown projects, so repeated misses skip the disk
+    app.state.missing_projects = {}
+    # (monotonic time, files) of the last list_codebase_files walk
+    app.state.codebase_listing = None
+    # Root listed by list_codebase_files; fixed for the container's lifetime
+    app.state.codebase_dir = "/app/codebase" if os.path.exists("/app/codebase") else "codebase"
     
     def find_codebase_file(project_path: str, filename: Optional[str] = None) -> str:
         """Find codebase file in project directory with fallback logic."""
-        search_paths = [
-            f"/app/codebase/{project_path}",
-            f"./codebase/{project_path}",
-            f"codebase/{project_path}"
+        full_path = None if filename else app.state.project_index.get(project_path)
+        if full_path is None:
+            missed_at = app.state.missing_projects.get((project_path, filename))
+            if missed_at is not None and time.monotonic() - missed_at < MISSING_PROJECT_TTL:
+                raise FileNotFoundError(f"No codebase file found in project: {project_path}")
+            
+            # Explicit filenames and projects added after indexing are resolved on disk
+            try:
+                full_path = resolve_project_file(project_path, filename)
+            except FileNotFoundError:
+                if len(app.state.missing_projects) >= MISSING_PROJECT_CACHE_SIZE:
+                    app.state.missing_projects.clear()
+                app.state.missing_projects[(project_path, filename)] = time.monotonic()
+                raise
+            app.state.missing_projects.pop((project_path, filename), None)
+            if not filename:
+                app.state.project_index[project_path] = full_path
+        logger.info(f"Found codebase file: {full_path}")
+        return full_path
+    
+    # Path of the codebase used by the deepview tool when no codebase_file is given; set by the CLI
+    app.state.default_codebase_file = None
+    
+    # Limits concurrent Gemini calls; excess questions wait instead of hitting 429s
+    gemini_slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else contextlib.nullcontext()
+    gemini_rate_limiter = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+    
+    def load_project_codebase(project_name: str, filename: Optional[str]) -> Tuple[str, CodebaseEntry]:
+        """Find and load a project's codebase file, returning its path and entry."""
+        codebase_file = find_codebase_file(project_name, filename)
+        try:
+            return codebase_file, load_codebase_entry(codebase_file, compress_ratio=compress_ratio)
+        except FileNotFoundError:
+            if filename or app.state.project_index.get(project_name) != codebase_file:
+                raise
+        
+        # The indexed file was renamed or removed; drop the stale entry and look on disk again.
+        # This also keeps workers that didn't handle a POST /reindex correct.
+        logger.info(f"Indexed codebase {codebase_file} is gone, resolving project {project_name} again")
+        app.state.project_index.pop(project_name, None)
+        codebase_file = find_codebase_file(project_name)
+        return codebase_file, load_codebase_entry(codebase_file, compress_ratio=compress_ratio)
+    
+    async def get_context_cache(project_name: str, codebase: CodebaseEntry,
+                                compressed: bool) -> Optional[caching.CachedContent]:
+        """Return a live Gemini context cache holding the system prompt and codebase content."""
+        if context_cache_ttl <= 0:
+            return None
+        
+        # Skip the create call Gemini would reject for a too-small context
+        size = len(codebase.compressed) if compressed else codebase.size
+        if size < CONTEXT_CACHE_MIN_BYTES:
+            return None
+        
+        # Fast path without a lock for a live cache or a remembered failure
+        key = (model_name, project_name, compressed)
+        if key in codebase.context_caches:
+            cached = codebase.context_caches[key]
+            if cached is None or _context_cache_is_live(cached):
+                return cached
+        if time.monotonic() < codebase.context_cache_retry_at.get(key, 0.0):
+            return None
+        
+        # Serialize creation per key so concurrent first questions don't upload the codebase twice
+        lock = codebase.context_cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            return await _get_or_create_context_cache(project_name, codebase, compressed)
+    
+    async def _get_or_create_context_cache(project_name: str, codebase: CodebaseEntry,
+                                           compressed: bool) -> Optional[caching.CachedContent]:
+        """Reuse an unexpired context cache or upload a new one; callers hold the key's lock."""
+        key = (model_name, project_name, compressed)
+        expired = None
+        if key in codebase.context_caches:
+            cached = codebase.context_caches[key]
+            if cached is None:
+                return None
+            # Another request may have created it while this one waited for the lock
+            if _context_cache_is_live(cached):
+                return cached
+            logger.info(f"Context cache for project {project_name} expired, recreating")
+            expired = cached
+        if time.monotonic() < codebase.context_cache_retry_at.get(key, 0.0):
+            return None
+        
+        # Separate parts keep the codebase out of a concatenated copy of the prompt
+        codebase_parts = [
+            _CODEBASE_PROMPT_PREFIX.format(project_name=project_name),
+            codebase.compressed if compressed else codebase.content,
+            _PROMPT_SUFFIX
         ]
         
-        default_filenames = ["codebase.xml", "codebase.txt", "codebase.md", "codebase.json"]
-        if filename:
-            default_filenames.insert(0, filename)
+        try:
+            cached = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=model_name,
+                display_name=f"deepview-{project_name}"[:128],
+                system_instruction=SYSTEM_PROMPT,
+                contents=[{"role": "user", "parts": codebase_parts}],
+                ttl=context_cache_ttl
+            )
+            logger.info(f"Created context cache {cached.name} for project {project_name}")
+        except BadRequest as e:
+            # Gemini rejected this content (InvalidArgument included); it won't succeed until the file changes
+            logger.warning(f"Context caching unavailable for project {project_name}: {str(e)}")
+            cached = None
+        except Exception as e:
+            # Rate limits, outages and network errors: send inline for now and retry later
+            logger.warning(f"Context cache creation failed for project {project_name}, "
+                           f"retrying in {CONTEXT_CACHE_RETRY_DELAY:.0f}s: {str(e)}")
+            codebase.context_cache_retry_at[key] = time.monotonic() + CONTEXT_CACHE_RETRY_DELAY
+            # Forget an expired cache; it is recreated once the retry delay passes
+            codebase.context_caches.pop(key, None)
+            codebase.context_models.pop(key, None)
+            release_context_caches([expired])
+            return None
         
-        for search_path in search_paths:
-            for fname in default_filenames:
-                full_path = f"{search_path}/{fname}"
-                if os.path.exists(full_path):
-                    logger.info(f"Found codebase file: {full_path}")
-                    return full_path
+        codebase.context_cache_retry_at.pop(key, None)
+        codebase.context_caches[key] = cached
+        if cached is not None:
+            codebase.context_models[key] = genai.GenerativeModel.from_cached_content(cached)
+        else:
+            codebase.context_models.pop(key, None)
+        superseded = [expired]
+        if compressed:
+            # Questions use the compressed text from now on, so the raw upload is unused
+            raw_key = (model_name, project_name, False)
+            codebase.context_models.pop(raw_key, None)
+            superseded.append(codebase.context_caches.pop(raw_key, None))
+        release_context_caches(superseded)
+        return cached
+    
+    async def iter_gemini_chunks(project_name: str, question: str, codebase: CodebaseEntry) -> AsyncIterator[str]:
+        """Stream answer text from Gemini, using the context cache when one is available."""
+        logger.info(f"Analyzing project {project_name} with model: {model_name}")
         
-        raise FileNotFoundError(f"No codebase file found in project: {project_path}")
-    
-    def analyze_with_gemini(project_name: str, question: str, codebase_content: str) -> str:
-        """Analyze codebase content with Gemini."""
-        system_prompt = (
-            "You are a diligent programming assistant analyzing code. Your task is to "
-            "answer questions about the provided code repository accurately and in detail. "
-            "Always include specific references to files, functions, and class names in your "
-            "responses. At the end, list related files, functions, and classes that could be "
-            "potentially relevant to the question, explaining their relevance."
-        )
-
-        user_prompt = f"""
-Below is the content of a code repository for project '{project_name}'. 
-Please answer the following question about the code:
-
-<QUESTION>
-{question}
-</QUESTION>
-
-<CODE_REPOSITORY>
-```
-{codebase_content}
-```
-</CODE_REPOSITORY>"""
+        # Snapshot the compressed text; background compression may finish mid-request
+        compressed_content = codebase.compressed
+        compressed = compressed_content is not None
+        
+        cached = await get_context_cache(project_name, codebase, compressed)
+        if cached is not None:
+            question_prompt = "".join((_QUESTION_PROMPT_PREFIX, question, _QUESTION_PROMPT_SUFFIX))
+            key = (model_name, project_name, compressed)
+            # Built with the cache in _get_or_create_context_cache; rebuilt only if it went missing
+            model = codebase.context_models.get(key)
+            if model is None or model.cached_content != cached.name:
+                model = codebase.context_models[key] = genai.GenerativeModel.from_cached_content(cached)
+            try:
+                response = await model.generate_content_async(question_prompt, stream=True)
+                async for chunk in response:
+                    yield chunk.text
+                return
+            except (NotFound, PermissionDenied):
+                # Gemini reports a deleted or expired cache as 403 "CachedContent not found
+                # (or permission denied)", older API versions as 404; recreate it on the next call
+                logger.warning(f"Context cache {cached.name} not found, falling back to full prompt")
+                codebase.context_caches.pop(key, None)
+                codebase.context_models.pop(key, None)
 
-        logger.info(f"Analyzing project {project_name} with model: {model_name}")
-        model = genai.GenerativeModel(model_name, system_instruction=system_prompt)
-        response = model.generate_content(user_prompt)
-        return response.text
+        # Sent as three parts of one user turn so the codebase isn't copied into a joined prompt
+        prompt_parts = [
+            "".join((_PROMPT_PREFIX.format(project_name=project_name), question, _PROMPT_MID)),
+            # Decode the snapshot only when the codebase has to be sent inline
+            compressed_content if compressed else codebase.content,
+            _PROMPT_SUFFIX
+        ]
+
+        response = await generative_model.generate_content_async(prompt_parts, stream=True)
+        async for chunk in response:
+            yield chunk.text
+    
+    async def stream_with_gemini(project_name: str, question: str, codebase: CodebaseEntry) -> AsyncIterator[str]:
+        """Stream an answer, replaying a cached answer as a single chunk."""
+        cache_key = (model_name, project_name, codebase.sha256, _normalize_question(question))
+        cached_answer = get_cached_answer(cache_key)
+        if cached_answer is not None:
+            logger.info(f"Answer cache hit for project {project_name}")
+            yield cached_answer
+            return
+        
+        if gemini_rate_limiter is not None:
+            await gemini_rate_limiter.acquire()
+        
+        parts = []
+        async with gemini_slots:
+            async for text in iter_gemini_chunks(project_name, question, codebase):
+                parts.append(text)
+                yield text
+        store_answer(cache_key, "".join(parts))
+    
+    async def analyze_with_gemini(project_name: str, question: str, codebase: CodebaseEntry) -> str:
+        """Analyze codebase content with Gemini, reusing cached answers for repeated questions."""
+        return "".join([text async for text in stream_with_gemini(project_name, question, codebase)])
+    
+    def sse_frame(message: Dict[str, Any]) -> str:
+        """Format a JSON-RPC message as a Server-Sent Events frame."""
+        return f"data: {orjson.dumps(message).decode()}\n\n"
+    
+    async def stream_deepview_events(request_id: Any, progress_token: Any, project_name: str,
+                                     question: str, codebase: CodebaseEntry) -> AsyncIterator[str]:
+        """Yield SSE frames for a deepview tool call: progress notifications, then the result."""
+        parts = []
+        try:
+            async for text in stream_with_gemini(project_name, question, codebase):
+                parts.append(text)
+                # Progress notifications are only allowed for requests that asked for them
+                if progress_token is not None:
+                    yield sse_frame({
+                        "jsonrpc": "2.0",
+                        "method": "notifications/progress",
+                        "params": {
+                            "progressToken": progress_token,
+                            "progress": len(parts),
+                            "message": text
+                        }
+                    })
+        except Exception as e:
+            logger.error(f"Error in deepview tool: {str(e)}")
+            yield sse_frame({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {
+                    "code": -32603,
+                    "message": "Internal error",
+                    "data": str(e)
+                }
+            })
+            return
+        
+        yield sse_frame({
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "".join(parts)
+                    }
+                ]
+            }
+        })
     
     # Health check endpoint
+    health_body = orjson.dumps({
+        "status": "healthy", 
+        "service": "DeepView MCP", 
+        "model": model_name
+    })
+    
     @app.get("/health")
-    def health_check():
+    async def health_check():
         """Health check endpoint for Docker health checks."""
-        return JSONResponse({
-            "status": "healthy", 
-            "service": "DeepView MCP", 
-            "model": model_name
-        })
+        return Response(health_body, media_type="application/json")
     
     # MCP protocol endpoint (following lzdocs pattern)
     # Support both GET and POST for MCP protocol
@@ -147,69 +945,24 @@ Please answer the following question about the code:
         try:
             # Handle GET requests (return server info)
             if request.method == "GET":
-                return JSONResponse({
-                    "name": "deepview-mcp",
-                    "version": "1.0.0",
-                    "description": "DeepView MCP Server for codebase analysis",
-                    "protocol": "mcp",
-                    "capabilities": ["tools"]
-                })
+                return Response(_MCP_INFO_BODY, media_type="application/json")
             
             # Handle POST requests (MCP protocol)
-            body = await request.json()
+            body = orjson.loads(await request.body())
             method = body.get("method")
             params = body.get("params", {})
             request_id = body.get("id")  # JSON-RPC requires matching response ID
             
             # Standard MCP initialization methods
             if method == "initialize":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "protocolVersion": "2024-11-05",
-                        "capabilities": {
-                            "tools": {}
-                        },
-                        "serverInfo": {
-                            "name": "deepview-mcp",
-                            "version": "1.0.0"
-                        }
-                    }
-                }
-                return JSONResponse(response)
+                return jsonrpc_result_response(request_id, _INITIALIZE_RESULT)
             
             elif method == "notifications/initialized":
                 # Notifications don't need responses in JSON-RPC
-                return JSONResponse({})
+                return Response(b"{}", media_type="application/json")
             
             elif method == "tools/list":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "tools": [
-                            {
-                                "name": "deepview",
-                                "description": "Analyze codebase content with AI",
-                                "inputSchema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "question": {"type": "string", "description": "Question about the codebase"},
-                                        "codebase_file": {"type": "string", "description": "Optional codebase file path"}
-                                    },
-                                    "required": ["question"]
-                                }
-                            },
-                            {
-                                "name": "list_codebase_files", 
-                                "description": "List available codebase files",
-                                "inputSchema": {"type": "object", "properties": {}}
-                            }
-                        ]
-                    }
-                }
-                return JSONResponse(response)
+                return jsonrpc_result_response(request_id, _TOOLS_LIST_RESULT)
             
             elif method == "tools/call":
                 tool_name = params.get("name")
@@ -220,23 +973,37 @@ Please answer the following question about the code:
                     codebase_file = arguments.get("codebase_file")
                     
                     if not question:
-                        return JSONResponse({"error": "Question is required"}, status_code=400)
+                        return json_response({"error": "Question is required"}, status_code=400)
                     
                     try:
-                        # Load codebase content
+                        # Load codebase content; the default codebase is re-checked like any other
+                        # file so a regenerated codebase isn't answered from stale caches
                         if codebase_file:
-                            local_codebase = load_codebase_from_file(codebase_file, update_global=False)
-                            project_name = os.path.basename(os.path.dirname(codebase_file))
+                            project_name = _project_for(codebase_file)
                         else:
-                            global codebase_content
-                            local_codebase = codebase_content
+                            codebase_file = request.app.state.default_codebase_file
                             project_name = "default"
                         
+                        local_codebase = None
+                        if codebase_file:
+                            # Reading and hashing a changed file would otherwise block the event loop
+                            local_codebase = await asyncio.to_thread(
+                                load_codebase_entry, codebase_file, compress_ratio=compress_ratio)
+                        
                         if not local_codebase:
-                            return JSONResponse({"error": "No codebase content available"}, status_code=404)
+                            return json_response({"error": "No codebase content available"}, status_code=404)
+                        
+                        # Stream the answer when the client accepts SSE (MCP Streamable HTTP)
+                        if "text/event-stream" in request.headers.get("accept", ""):
+                            progress_token = params.get("_meta", {}).get("progressToken")
+                            return StreamingResponse(
+                                stream_deepview_events(request_id, progress_token, project_name,
+                                                       question, local_codebase),
+                                media_type="text/event-stream"
+                            )
                         
                         # Analyze with Gemini
-                        answer = analyze_with_gemini(project_name, question, local_codebase)
+                        answer = await analyze_with_gemini(project_name, question, local_codebase)
                         
                         response = {
                             "jsonrpc": "2.0",
@@ -250,7 +1017,7 @@ Please answer the following question about the code:
                                 ]
                             }
                         }
-                        return JSONResponse(response)
+                        return json_response(response)
                         
                     except Exception as e:
                         logger.error(f"Error in deepview tool: {str(e)}")
@@ -263,19 +1030,18 @@ Please answer the following question about the code:
                                 "data": str(e)
                             }
                         }
-                        return JSONResponse(error_response, status_code=500)
+                        return json_response(error_response, status_code=500)
                 
                 elif tool_name == "list_codebase_files":
                     try:
-                        files = []
-                        codebase_dir = "/app/codebase" if os.path.exists("/app/codebase") else "codebase"
-                        
-                        if os.path.exists(codebase_dir):
-                            for root, dirs, file_list in os.walk(codebase_dir):
-                                for file in file_list:
-                                    if file.endswith(('.xml', '.txt', '.md', '.json')):
-                                        rel_path = os.path.relpath(os.path.join(root, file), codebase_dir)
-                                        files.append(rel_path)
+                        listing = request.app.state.codebase_listing
+                        if listing is not None and time.monotonic() - listing[0] < CODEBASE_LISTING_TTL:
+                            files = listing[1]
+                        else:
+                            codebase_dir = request.app.state.codebase_dir
+                            files = await asyncio.to_thread(
+                                lambda: list(iter_codebase_files(codebase_dir, codebase_dir)))
+                            request.app.state.codebase_listing = (time.monotonic(), files)
                         
                         response = {
                             "jsonrpc": "2.0",
@@ -289,7 +1055,7 @@ Please answer the following question about the code:
                                 ]
                             }
                         }
-                        return JSONResponse(response)
+                        return json_response(response)
                         
                     except Exception as e:
                         error_response = {
@@ -301,7 +1067,7 @@ Please answer the following question about the code:
                                 "data": str(e)
                             }
                         }
-                        return JSONResponse(error_response, status_code=500)
+                        return json_response(error_response, status_code=500)
             
             # Unknown method error
             error_response = {
@@ -313,31 +1079,40 @@ Please answer the following question about the code:
                     "data": f"Unknown method: {method}"
                 }
             }
-            return JSONResponse(error_response, status_code=400)
+            return json_response(error_response, status_code=400)
             
         except Exception as e:
             logger.error(f"MCP endpoint error: {str(e)}")
-            return JSONResponse({"error": str(e)}, status_code=500)
+            return json_response({"error": str(e)}, status_code=500)
     
     # REST endpoints for direct HTTP access
     @app.get("/{project_name}")
-    def analyze_project_get(
+    @app.get("/codebase/{project_name}")
+    async def analyze_project_get(
         project_name: str,
         question: str = Query(..., description="Question to ask about the codebase"),
-        filename: Optional[str] = Query(None, description="Optional specific codebase filename")
+        filename: Optional[str] = Query(None, description="Optional specific codebase filename"),
+        stream: bool = Query(False, description="Stream the answer as plain text while it is generated")
     ):
-        """Analyze a project via GET request with URL path."""
+        """Analyze a project via GET request with URL path, with or without the /codebase/ prefix."""
         try:
-            codebase_file = find_codebase_file(project_name, filename)
-            local_codebase = load_codebase_from_file(codebase_file, update_global=False)
+            # Resolve and load in one worker thread; an unindexed project means directory listings
+            codebase_file, local_codebase = await asyncio.to_thread(
+                load_project_codebase, project_name, filename)
             
             if not local_codebase:
                 raise HTTPException(status_code=404, detail="No codebase content found")
             
+            if stream:
+                return StreamingResponse(
+                    stream_with_gemini(project_name, question, local_codebase),
+                    media_type="text/plain; charset=utf-8"
+                )
+            
             # Analyze with Gemini
-            answer = analyze_with_gemini(project_name, question, local_codebase)
+            answer = await analyze_with_gemini(project_name, question, local_codebase)
             
-            return JSONResponse({
+            return json_response({
                 "project": project_name,
                 "codebase_file": codebase_file,
                 "question": question,
@@ -351,30 +1126,61 @@ Please answer the following question about the code:
             logger.error(f"Error analyzing project {project_name}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
     
-    @app.get("/codebase/{project_name}")
-    def analyze_codebase_project_get(
-        project_name: str,
-        question: str = Query(..., description="Question to ask about the codebase"),
-        filename: Optional[str] = Query(None, description="Optional specific codebase filename")
-    ):
-        """Analyze a project via GET request with /codebase/ prefix."""
-        return analyze_project_get(project_name, question, filename)
+    @app.post("/reindex")
+    def reindex_projects():
+        """Rebuild the project index after codebase files are added, moved or removed."""
+        app.state.project_index = build_project_index()
+        app.state.missing_projects.clear()
+        app.state.codebase_listing = None
+        return json_response({"projects": sorted(app.state.project_index)})
     
-    # OAuth/OpenID endpoints that Windsurf looks for (return minimal responses)
-    @app.get("/.well-known/oauth-protected-resource")
-    def oauth_protected_resource():
-        return JSONResponse({"error": "not_supported"}, status_code=404)
+    # OAuth/OpenID endpoints that Windsurf looks for (return minimal responses).
+    # Windsurf probes these repeatedly, so bodies are pre-serialized and the
+    # handlers are async to skip the threadpool hop.
+    @app.api_route("/.well-known/oauth-protected-resource", methods=["GET", "HEAD"])
+    async def oauth_protected_resource():
+        return Response(_OAUTH_NOT_SUPPORTED_BODY, status_code=404, media_type="application/json")
     
-    @app.get("/.well-known/openid-configuration")
-    def openid_configuration():
-        return JSONResponse({"error": "not_supported"}, status_code=404)
+    @app.api_route("/.well-known/openid-configuration", methods=["GET", "HEAD"])
+    async def openid_configuration():
+        return Response(_OAUTH_NOT_SUPPORTED_BODY, status_code=404, media_type="application/json")
     
-    @app.get("/.well-known/oauth-authorization-server")
-    def oauth_authorization_server():
-        return JSONResponse({"error": "not_supported"}, status_code=404)
+    @app.api_route("/.well-known/oauth-authorization-server", methods=["GET", "HEAD"])
+    async def oauth_authorization_server():
+        return Response(_OAUTH_NOT_SUPPORTED_BODY, status_code=404, media_type="application/json")
     
     @app.post("/register")
-    def register_client():
-        return JSONResponse({"error": "registration_not_supported"}, status_code=405)
+    async def register_client():
+        return Response(_REGISTRATION_NOT_SUPPORTED_BODY, status_code=405, media_type="application/json")
+    
+    return app
+
+
+def build_app() -> FastAPI:
+    """
+    Build the server from environment variables.
+    
+    Used as a uvicorn factory so that each worker process builds its own app
+    instead of receiving a pickled one. The CLI exports its resolved options
+    to the environment before starting uvicorn.
+    """
+    compress_ratio = os.getenv("COMPRESS_RATIO")
+    compress_ratio = float(compress_ratio) if compress_ratio else None
+    
+    app = create_http_server(
+        model_name=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+        host=os.getenv("MCP_HOST", "0.0.0.0"),
+        port=int(os.getenv("MCP_PORT", "8019")),
+        context_cache_ttl=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600")),
+        compress_ratio=compress_ratio,
+        max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "0")),
+        requests_per_minute=int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "0"))
+    )
+    
+    codebase_file = os.getenv("DEEPVIEW_CODEBASE_FILE")
+    if codebase_file:
+        # Load once up front to fail fast and start any background compression
+        load_codebase_entry(codebase_file, compress_ratio=compress_ratio)
+        app.state.default_codebase_file = codebase_file
     
     return app
@@ -0,0 +1,24 @@
+"""
+Shared fixtures for the deepview_mcp tests.
+"""
+
+import pytest
+
+from deepview_mcp import server
+
+
+class FakeClock:
+    """Stand-in for the time module with a manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(server, "time", fake)
+    return fake
@@ -0,0 +1,350 @@
+"""
+Tests for the HTTP app built by deepview_mcp.server.create_http_server.
+
+Gemini is replaced by an in-process fake that records prompts and context
+cache calls, so responses, compression and cache handling are checked
+without network access.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core.exceptions import BadRequest, PermissionDenied, ServiceUnavailable
+
+from deepview_mcp import server
+
+# Large enough for a context cache (see CONTEXT_CACHE_MIN_BYTES)
+LARGE_CODEBASE = "def handler():\n    return 'ok'\n" * 200
+
+
+class FakeResponse:
+    """Streamed generate_content_async result yielding canned chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        for text in self._chunks:
+            yield SimpleNamespace(text=text)
+
+
+class FakeCachedContent:
+    """Context cache handle that records its deletion."""
+
+    def __init__(self, gemini, name, model):
+        self._gemini = gemini
+        self.name = name
+        self.model = model
+        self.expire_time = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    def delete(self):
+        self._gemini.deleted.append(self.name)
+        self._gemini.deleted_event.set()
+
+
+class FakeGemini:
+    """Records Gemini calls and plays back canned answers and errors."""
+
+    def __init__(self):
+        self.chunks = ["The answer."]
+        # (context cache name or None, prompt) of every generate call
+        self.prompts = []
+        self.create_calls = 0
+        self.created = []
+        # Raised by upcoming CachedContent.create calls and generate calls on cached models
+        self.create_errors = []
+        self.generate_errors = []
+        self.models_from_cache = 0
+        self.deleted = []
+        self.deleted_event = threading.Event()
+
+    def create_cache(self, model, display_name, system_instruction, contents, ttl):
+        self.create_calls += 1
+        if self.create_errors:
+            raise self.create_errors.pop(0)
+        cached = FakeCachedContent(self, f"cachedContents/{len(self.created)}", model)
+        self.created.append(cached.name)
+        return cached
+
+    def model_class(gemini):
+        class FakeModel:
+            def __init__(self, model_name, system_instruction=None, **kwargs):
+                self.cached_content = None
+
+            @classmethod
+            def from_cached_content(cls, cached):
+                gemini.models_from_cache += 1
+                model = cls(cached.model)
+                model.cached_content = cached.name
+                return model
+
+            async def generate_content_async(self, prompt, stream=False):
+                gemini.prompts.append((self.cached_content, prompt))
+                if self.cached_content and gemini.generate_errors:
+                    raise gemini.generate_errors.pop(0)
+                return FakeResponse(list(gemini.chunks))
+
+        return FakeModel
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(server.genai, "GenerativeModel", fake.model_class())
+    monkeypatch.setattr(server.genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(server.caching.CachedContent, "create", fake.create_cache)
+    server.get_generative_model.cache_clear()
+    yield fake
+    server.get_generative_model.cache_clear()
+
+
+@pytest.fixture
+def codebase_root(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    root = tmp_path / "codebase"
+    root.mkdir()
+    monkeypatch.setattr(server, "CODEBASE_ROOTS", [str(root)])
+    for name in ("_answer_cache", "_codebase_cache"):
+        monkeypatch.setattr(server, name, OrderedDict())
+    for name in ("_path_cache", "_project_path_cache"):
+        monkeypatch.setattr(server, name, {})
+    return root
+
+
+@pytest.fixture
+def make_client(gemini, codebase_root):
+    def make(**kwargs):
+        return TestClient(server.create_http_server(**kwargs))
+    return make
+
+
+def write_project(root, project, text, filename="codebase.xml"):
+    project_dir = root / project
+    project_dir.mkdir(exist_ok=True)
+    (project_dir / filename).write_text(text)
+    return project_dir / filename
+
+
+def call_deepview(client, question, accept="application/json", progress_token=None):
+    params = {
+        "name": "deepview",
+        "arguments": {"question": question, "codebase_file": "codebase/proj/codebase.xml"}
+    }
+    if progress_token is not None:
+        params["_meta"] = {"progressToken": progress_token}
+    return client.post(
+        "/deepview-mcp/mcp",
+        content=orjson.dumps({"jsonrpc": "2.0", "id": 7, "method": "tools/call", "params": params}),
+        headers={"Accept": accept, "Content-Type": "application/json"}
+    )
+
+
+def sse_messages(response):
+    assert response.text.endswith("\n\n")
+    frames = response.text.split("\n\n")[:-1]
+    assert all(frame.startswith("data: ") for frame in frames)
+    return [orjson.loads(frame[len("data: "):]) for frame in frames]
+
+
+def test_json_answer_is_gzipped(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", "print('hi')\n")
+    gemini.chunks = ["x" * 2048]
+
+    response = make_client().get("/proj", params={"question": "What?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["answer"] == "x" * 2048
+
+
+@pytest.mark.parametrize("stream", ["true", "1"])
+def test_streamed_answer_is_not_gzipped(make_client, codebase_root, gemini, stream):
+    write_project(codebase_root, "proj", "print('hi')\n")
+    gemini.chunks = ["x" * 1024, "y" * 1024]
+
+    response = make_client().get("/proj", params={"question": "What?", "stream": stream})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "content-encoding" not in response.headers
+    assert response.text == "x" * 1024 + "y" * 1024
+
+
+def test_mcp_json_tool_call_is_gzipped(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", "print('hi')\n")
+    gemini.chunks = ["x" * 2048]
+
+    response = call_deepview(make_client(), "What?")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == {
+        "jsonrpc": "2.0",
+        "id": 7,
+        "result": {"content": [{"type": "text", "text": "x" * 2048}]}
+    }
+
+
+def test_sse_tool_call_sends_progress_then_result(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", "print('hi')\n")
+    gemini.chunks = ["x" * 1024, "y" * 1024]
+
+    response = call_deepview(make_client(), "What?", accept="application/json, text/event-stream",
+                             progress_token="tok")
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "content-encoding" not in response.headers
+    progress, more_progress, result = sse_messages(response)
+    assert progress["method"] == "notifications/progress"
+    assert progress["params"] == {"progressToken": "tok", "progress": 1, "message": "x" * 1024}
+    assert more_progress["params"] == {"progressToken": "tok", "progress": 2, "message": "y" * 1024}
+    assert result["id"] == 7
+    assert result["result"]["content"][0]["text"] == "x" * 1024 + "y" * 1024
+
+
+def test_sse_tool_call_without_progress_token_sends_only_result(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", "print('hi')\n")
+    gemini.chunks = ["Part one. ", "Part two."]
+
+    response = call_deepview(make_client(), "What?", accept="application/json, text/event-stream")
+
+    (result,) = sse_messages(response)
+    assert result["id"] == 7
+    assert result["result"]["content"][0]["text"] == "Part one. Part two."
+
+
+def test_rejected_context_cache_is_not_retried(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", LARGE_CODEBASE)
+    gemini.create_errors = [BadRequest("Cached content is too small")]
+    client = make_client()
+
+    for question in ("First?", "Second?"):
+        assert client.get("/proj", params={"question": question}).status_code == 200
+
+    assert gemini.create_calls == 1
+    assert [name for name, _ in gemini.prompts] == [None, None]
+
+
+def test_transient_context_cache_failure_is_retried_after_delay(make_client, codebase_root, gemini, fake_time):
+    write_project(codebase_root, "proj", LARGE_CODEBASE)
+    gemini.create_errors = [ServiceUnavailable("overloaded")]
+    client = make_client()
+
+    client.get("/proj", params={"question": "First?"})
+    client.get("/proj", params={"question": "Second?"})
+    assert gemini.create_calls == 1
+
+    fake_time.now += server.CONTEXT_CACHE_RETRY_DELAY
+    client.get("/proj", params={"question": "Third?"})
+    client.get("/proj", params={"question": "Fourth?"})
+
+    assert gemini.create_calls == 2
+    assert [name for name, _ in gemini.prompts] == [None, None, "cachedContents/0", "cachedContents/0"]
+    # Only the question is sent alongside a context cache, through one model per cache
+    assert "Fourth?" in gemini.prompts[-1][1] and LARGE_CODEBASE not in gemini.prompts[-1][1]
+    assert gemini.models_from_cache == 1
+
+
+def test_context_cache_reported_missing_is_recreated(make_client, codebase_root, gemini):
+    write_project(codebase_root, "proj", LARGE_CODEBASE)
+    gemini.generate_errors = [PermissionDenied("CachedContent not found (or permission denied)")]
+    gemini.chunks = ["Inline answer."]
+    client = make_client()
+
+    response = client.get("/proj", params={"question": "First?"})
+    assert response.json()["answer"] == "Inline answer."
+    client.get("/proj", params={"question": "Second?"})
+
+    assert [name for name, _ in gemini.prompts] == ["cachedContents/0", None, "cachedContents/1"]
+
+
+def test_changed_codebase_deletes_its_context_cache(make_client, codebase_root, gemini):
+    path = write_project(codebase_root, "proj", LARGE_CODEBASE)
+    client = make_client()
+
+    client.get("/proj", params={"question": "What?"})
+    path.write_text(LARGE_CODEBASE + "# changed\n")
+    client.get("/proj", params={"question": "What?"})
+
+    assert gemini.created == ["cachedContents/0", "cachedContents/1"]
+    assert gemini.deleted_event.wait(5)
+    assert gemini.deleted == ["cachedContents/0"]
+
+
+def test_renamed_indexed_codebase_is_found_again(make_client, codebase_root, gemini):
+    path = write_project(codebase_root, "proj", "print('hi')\n")
+    client = make_client()
+    assert client.get("/proj", params={"question": "What?"}).json()["codebase_file"].endswith("/proj/codebase.xml")
+
+    path.rename(path.with_name("codebase.md"))
+    response = client.get("/proj", params={"question": "What?"})
+
+    assert response.status_code == 200
+    assert response.json()["codebase_file"].endswith("/proj/codebase.md")
+
+
+def test_removed_indexed_project_is_not_found(make_client, codebase_root, gemini):
+    path = write_project(codebase_root, "proj", "print('hi')\n")
+    client = make_client()
+
+    path.unlink()
+    path.parent.rmdir()
+
+    assert client.get("/proj", params={"question": "What?"}).status_code == 404
+
+
+class RewrittenWhileRead:
+    """File wrapper that rewrites the file on disk during each of its first reads."""
+
+    def __init__(self, f, path, rewrites):
+        self._f = f
+        self._path = path
+        self._rewrites = rewrites
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._f.close()
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def seek(self, offset):
+        return self._f.seek(offset)
+
+    def read(self):
+        data = self._f.read()
+        if self._rewrites:
+            self._path.write_bytes(self._rewrites.pop(0))
+        return data
+
+
+def test_codebase_rewritten_during_read_is_read_again(monkeypatch, codebase_root):
+    path = codebase_root / "codebase.xml"
+    path.write_bytes(b"old")
+    rewrites = [b"new content"]
+    monkeypatch.setattr(server, "open", lambda p, mode: RewrittenWhileRead(open(p, mode), path, rewrites),
+                        raising=False)
+
+    entry = server._read_codebase(str(path))
+
+    assert entry.data == b"new content"
+    assert entry.size == len(b"new content")
+
+
+def test_codebase_that_keeps_changing_is_rejected(monkeypatch, codebase_root):
+    path = codebase_root / "codebase.xml"
+    path.write_bytes(b"0")
+    rewrites = [b"1" * n for n in range(2, 6)]
+    monkeypatch.setattr(server, "open", lambda p, mode: RewrittenWhileRead(open(p, mode), path, rewrites),
+                        raising=False)
+
+    with pytest.raises(OSError, match="kept changing"):
+        server._read_codebase(str(path))
+    assert server._codebase_cache == OrderedDict()
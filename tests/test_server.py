@@ -0,0 +1,149 @@
+"""
+Tests for the timing-sensitive caches and limiters in deepview_mcp.server.
+
+A fake clock replaces the server module's time source, so expiry and refill
+are checked deterministically instead of by sleeping.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+
+import pytest
+
+from deepview_mcp import server
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_time):
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        # Advance the clock instead of waiting, then let other tasks run
+        fake_time.now += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(server.asyncio, "sleep", fake_sleep)
+    return fake_time
+
+
+@pytest.fixture
+def answer_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(server, "_answer_cache", cache)
+    return cache
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    async def run():
+        bucket = server.TokenBucket(3, period=3.0)
+        for _ in range(3):
+            await bucket.acquire()
+        burst_end = clock.now
+
+        await bucket.acquire()
+        return burst_end
+
+    burst_end = asyncio.run(run())
+    assert burst_end == 1000.0
+    # One token refills per second at 3 per 3 seconds
+    assert clock.now == pytest.approx(1001.0)
+
+
+def test_token_bucket_refill_is_capped_at_capacity(clock):
+    async def run():
+        bucket = server.TokenBucket(2, period=1.0)
+        await bucket.acquire()
+        clock.now += 60
+        for _ in range(2):
+            await bucket.acquire()
+        start = clock.now
+        await bucket.acquire()
+        return start
+
+    start = asyncio.run(run())
+    assert clock.now - start == pytest.approx(0.5)
+
+
+def test_token_bucket_serves_waiters_in_arrival_order(clock):
+    async def run():
+        bucket = server.TokenBucket(1, period=1.0)
+        await bucket.acquire()
+        order = []
+
+        async def waiter(name):
+            await bucket.acquire()
+            order.append(name)
+
+        await asyncio.gather(*(waiter(name) for name in "abc"))
+        return order
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+    assert clock.now == pytest.approx(1003.0)
+
+
+def test_cached_answer_expires_after_ttl(clock, answer_cache):
+    key = ("model", "project", "sha", "question")
+    server.store_answer(key, "answer")
+
+    clock.now += server.ANSWER_CACHE_TTL - 1
+    assert server.get_cached_answer(key) == "answer"
+
+    clock.now += 1
+    assert server.get_cached_answer(key) is None
+    assert key not in answer_cache
+
+
+def test_answer_cache_evicts_least_recently_used(monkeypatch, clock, answer_cache):
+    monkeypatch.setattr(server, "ANSWER_CACHE_SIZE", 2)
+    first, second, third = (("model", "project", "sha", q) for q in "abc")
+
+    server.store_answer(first, "1")
+    server.store_answer(second, "2")
+    # Reading the first answer makes the second the least recently used
+    assert server.get_cached_answer(first) == "1"
+    server.store_answer(third, "3")
+
+    assert server.get_cached_answer(second) is None
+    assert server.get_cached_answer(first) == "1"
+    assert server.get_cached_answer(third) == "3"
+
+
+def test_question_whitespace_is_normalized():
+    assert server._normalize_question("  what  does\nthis do? ") == "what does this do?"
+
+
+def test_project_file_resolution_follows_directory_mtime(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "CODEBASE_ROOTS", [str(tmp_path)])
+    monkeypatch.setattr(server, "_project_path_cache", {})
+    project_dir = tmp_path / "proj"
+    project_dir.mkdir()
+    (project_dir / "codebase.md").write_text("md")
+    dir_mtime_ns = project_dir.stat().st_mtime_ns
+
+    assert server.resolve_project_file("proj") == f"{tmp_path}/proj/codebase.md"
+
+    # Adding a file without a directory mtime change keeps serving the cached path
+    (project_dir / "codebase.xml").write_text("xml")
+    os.utime(project_dir, ns=(dir_mtime_ns, dir_mtime_ns))
+    assert server.resolve_project_file("proj") == f"{tmp_path}/proj/codebase.md"
+
+    # A changed mtime invalidates it, and codebase.xml takes priority
+    os.utime(project_dir, ns=(dir_mtime_ns, dir_mtime_ns + 1_000_000_000))
+    assert server.resolve_project_file("proj") == f"{tmp_path}/proj/codebase.xml"
+
+
+def test_project_file_resolution_drops_removed_projects(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "CODEBASE_ROOTS", [str(tmp_path)])
+    monkeypatch.setattr(server, "_project_path_cache", {})
+    project_dir = tmp_path / "proj"
+    project_dir.mkdir()
+    (project_dir / "codebase.txt").write_text("txt")
+
+    assert server.resolve_project_file("proj") == f"{tmp_path}/proj/codebase.txt"
+
+    (project_dir / "codebase.txt").unlink()
+    project_dir.rmdir()
+    with pytest.raises(FileNotFoundError):
+        server.resolve_project_file("proj")
+    assert server._project_path_cache == {}